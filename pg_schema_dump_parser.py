@@ -5,6 +5,7 @@
 # $ python pg_schema_dump_parser.py --directory . --configfile pg_schema_dump.config
 #
 
+import io
 import os
 import logging
 import re
@@ -12,79 +13,136 @@ import argparse
 import subprocess
 import configparser
 import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from time import time
+from typing import Iterable, Iterator
+
+import psycopg
+
+# Hyperscan matches all segment rules in a single pass when it is installed, see classify
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
 
 
 APPLICATION_NAME = 'pg_schema_dump_parser'
+# the dump is read in blocks of 1 MiB, large view and function bodies then only take a read or two
+READ_SIZE = 1024 * 1024
 warnings = False
+# definitions written to each schema file, so appends can skip duplicates without reading the file back
+written_definitions = defaultdict(set)
+# definitions of each schema file in order, buffered until all segments are parsed
+pending_writes = defaultdict(list)
+# schema directories already created during this run
+created_directories = set()
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s', encoding='utf-8', level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
 logger = logging.getLogger(APPLICATION_NAME)
 
-
-def generate_metadata(directory: str, elapsed_time: str, warnings: bool) -> str:
+# 'CREATE (?:UNLOGGED )?SEQUENCE' allows for UNLOGGED SEQUENCE.
+# added 'CREATE COLLATION'
+# every alternative spells out its optional keywords instead of using .*, so a segment is never rescanned from each position.
+# comments and acls only skip identifier words (and quoted column lists) before the name, so a dotted word in the comment text or in a role name never matches.
+OBJECT_PATTERN = re.compile(
+    r"(?i)^("
+    r"CREATE (?:UNLOGGED |FOREIGN )?TABLE"
+    r"|COMMENT ON \w+(?: \w+)*?"
+    r"|CREATE AGGREGATE"
+    r"|CREATE (?:OR REPLACE )?(?:MATERIALIZED )?VIEW"
+    r"|CREATE TYPE"
+    r"|CREATE DOMAIN"
+    r"|CREATE COLLATION"
+    r"|CREATE (?:UNLOGGED )?SEQUENCE"
+    r"|ALTER (?:FOREIGN )?TABLE(?: \w+)?"
+    r'|(?:GRANT|REVOKE) [\w ,()"]*?\bON \w+'
+    r"|(?:CREATE (?:OR REPLACE )?(?:CONSTRAINT )?|ALTER )TRIGGER [^\n]*?\bON"
+    r"|CREATE (?:OR REPLACE )?RULE [^\n]*?\bAS\s+ON \w+ TO"
+    r"|ALTER RULE [^\n]*?\bON"
+    r")\s+(\w+)\.(\w+)"
+)
+INDEX_PATTERN = re.compile(r"(?i)^CREATE (?:UNIQUE )?INDEX (\w+) ON (?:ONLY )?(\w+)\.(\w+)")
+EXTENSION_PATTERN = re.compile(r"(?i)^CREATE EXTENSION (?:IF NOT EXISTS )?(\w+) WITH SCHEMA (\w+)")
+FUNCTION_PATTERN = re.compile(r"(?i)^(CREATE (?:OR REPLACE )?(?:FUNCTION|PROCEDURE))\s+(\w+)\.(\w+)")
+ENABLE_TRIGGER_PATTERN = re.compile(r"ENABLE.*TRIGGER")
+ENABLE_RULE_PATTERN = re.compile(r"ENABLE.*RULE")
+# SQL comments, blank lines and SET statements of the dump
+DUMP_NOISE_PATTERN = re.compile(rb"(?m)^(?:--.*|\s*|SET.*)\n")
+
+
+def generate_metadata(directory: str, host: str, dbname: str, database_version: str, pg_dump_version: str, elapsed_time: str, warnings: bool) -> str:
     """ Generates metadata """
 
-    host = config.get('postgresql', 'host')
-    port = config.get('postgresql', 'port')
-    dbname = config.get('postgresql', 'db')
-    user = config.get('postgresql', 'user')
-    password = config.get('postgresql', 'password')
-
-    database_version = subprocess.Popen(
-        ['psql',
-        f"--dbname=postgresql://{user}:{password}@{host}:{port}/{dbname}?application_name={APPLICATION_NAME}",
-         "-A",
-         "--no-align",
-         "--no-psqlrc",
-         "--tuples-only",
-         f"-c SELECT setting FROM pg_catalog.pg_settings WHERE name = 'server_version'"],
-        stdout=subprocess.PIPE
-    )  # pylint: disable=R1732
-
-    pg_dump_version = subprocess.Popen(
-        ['pg_dump',
-         "--version",
-         ],
-        stdout=subprocess.PIPE
-    )  # pylint: disable=R1732
-
     database_name = f"database_name: {dbname}"
     database_host = f"database_host: {host}"
     file_name = f"{directory}/schema/METADATA"
-    database_version = f"database_version: {database_version.communicate()[0].decode('utf-8').strip()}"
-    pg_dump_version = re.search(r"([0-9]*[.]?[0-9]+)", pg_dump_version.communicate()[0].decode('utf-8').strip()).group(1)
+    database_version = f"database_version: {database_version}"
     pg_dump_version = f"pg_dump_version: {pg_dump_version}"
 
-    if not os.path.exists(file_name):
-        with open(file_name, 'a', encoding='utf-8') as file:
-            file.write('# Do not edit\n' + f"# Generated by {APPLICATION_NAME} " + str(datetime.now(timezone.utc)) + f"\n# Schema parsing completed in {elapsed_time}\n\n")
-            file.write(database_version + '\n')
-            file.write(pg_dump_version + '\n')
-            file.write(database_name + '\n')
-            file.write(database_host + '\n')
-            file.write(f"warnings: {warnings}" + '\n')
-
-
-def read_in_chunk(stream: str, separator: str) -> str:
-    """ Read in chunk https://stackoverflow.com/questions/47927039/reading-a-file-until-a-specific-character-in-python """
-    buffer = ''
+    # the metadata is never overwritten, creating the file fails if it already exists
+    try:
+        file = open(file_name, 'x', encoding='utf-8')  # pylint: disable=R1732
+    except FileExistsError:
+        return
+
+    with file:
+        file.write('# Do not edit\n' + f"# Generated by {APPLICATION_NAME} " + str(datetime.now(timezone.utc)) + f"\n# Schema parsing completed in {elapsed_time}\n\n")
+        file.write(database_version + '\n')
+        file.write(pg_dump_version + '\n')
+        file.write(database_name + '\n')
+        file.write(database_host + '\n')
+        file.write(f"warnings: {warnings}" + '\n')
+
+
+def read_in_chunk(chunks: Iterable[bytes], separator: bytes) -> bytes:
+    """ Read in chunk, yielding the parts of the chunked stream between separators """
+    # the incomplete part is kept as the list of its chunks, they are only joined once a separator shows up,
+    # so a part spanning many chunks is copied once instead of on every chunk
+    pending = []
+    # a separator split across chunks starts in the last len(separator) - 1 bytes of the incomplete part
+    carry = len(separator) - 1
+    tail = b''
+    for chunk in chunks:
+        pending.append(chunk)
+        if separator in chunk or separator in tail + chunk[:carry]:
+            # the pending chunks are split in a single call, the last part is incomplete and carried over
+            *parts, rest = b''.join(pending).split(separator)
+            yield from parts
+            pending = [rest]
+            tail = rest[-carry:] if carry else b''
+        elif carry:
+            tail = (tail + chunk[-carry:])[-carry:]
+    yield b''.join(pending)
+
+
+def clean_dump(stream: io.BufferedReader) -> bytes:
+    """ Reads the dump in chunks, cleaning up SET and SQL comments and blank lines """
+    rest = b''
     while True:  # until EOF
-        chunk = stream.readline(4096)  # 4096
+        chunk = stream.read(READ_SIZE)
         if not chunk:  # EOF?
-            yield buffer
             break
-        buffer += chunk
-        while True:  # until no separator is found
-            try:
-                part, buffer = buffer.split(separator, 1)
-            except ValueError:
-                break
-            else:
-                yield part
-
-
-def pg_schema_dump(host: str, dbname: str, schema: str, port: str, user: str, password: str) -> str:
+        chunk = rest + chunk
+        # lines are only cleaned up once complete, the last partial line is carried over to the next chunk
+        end = chunk.rfind(b'\n') + 1
+        rest = chunk[end:]
+        yield DUMP_NOISE_PATTERN.sub(b'', chunk[:end])
+    if rest:
+        # a last line without a newline is either dropped as a whole or kept as is
+        yield DUMP_NOISE_PATTERN.sub(b'', rest + b'\n')[:len(rest)]
+
+
+def prefetch(chunks: Iterator[bytes]) -> bytes:
+    """ Reads the next chunk in a background thread while the current one is being parsed """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(next, chunks, None)
+        while (chunk := future.result()) is not None:
+            future = executor.submit(next, chunks, None)
+            yield chunk
+
+
+def pg_schema_dump(connection_string: str, schema: str) -> str:
     """ Get schema dump of a postgres database """
 
     parschema = '--schema'
@@ -99,8 +157,8 @@ def pg_schema_dump(host: str, dbname: str, schema: str, port: str, user: str, pa
         [
             x for x in
             [
-                r'pg_dump.exe',
-                f"--dbname=postgresql://{user}:{password}@{host}:{port}/{dbname}?application_name={APPLICATION_NAME}",
+                pg_dump_path,
+                f"--dbname={connection_string}",
                 "--schema-only",
                 "--no-owner",
                 f"{parschema}",
@@ -109,96 +167,94 @@ def pg_schema_dump(host: str, dbname: str, schema: str, port: str, user: str, pa
             ]
             if x
         ],
+        bufsize=READ_SIZE,
         stdout=subprocess.PIPE
     )  # pylint: disable=R1732
-    # clean up SET and SQL comments
-    modified_dump = subprocess.Popen(['sed', '/^--/d;/^\\s*$/d;/^SET/d'], text=True, stdin=pg_dump_proc.stdout, stdout=subprocess.PIPE)  # pylint: disable=R1732
-    return modified_dump.stdout
+    return pg_dump_proc.stdout
+
+
+def get_function_definitions() -> dict:
+    """ Get the definitions of all functions and procedures in a single query, keyed by schema and name """
+
+    # overloaded functions share a schema file, so their definitions are aggregated by name.
+    # aggregates are parsed from the dump and functions belonging to extensions are not dumped.
+    # the dump decides which schemas are parsed (pg_dump matches --schema as a pattern), so only system schemas are left out here.
+    # prokind replaced proisagg in PostgreSQL 11
+    not_aggregate = "p.prokind <> 'a'" if connection.info.server_version >= 110000 else "NOT p.proisagg"
+    query = f"""SELECT n.nspname, p.proname, pg_catalog.string_agg(pg_catalog.pg_get_functiondef(p.oid), E';\n' ORDER BY p.oid) || ';'
+        FROM pg_catalog.pg_proc p JOIN pg_catalog.pg_namespace n ON n.oid = p.pronamespace
+        WHERE n.nspname NOT IN ('pg_catalog', 'information_schema') AND {not_aggregate}
+        AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_depend d WHERE d.classid = 'pg_catalog.pg_proc'::regclass AND d.objid = p.oid AND d.deptype = 'e')
+        GROUP BY n.nspname, p.proname"""
+
+    return {(schema_name, func_name): func_def for schema_name, func_name, func_def in connection.execute(query)}
 
 
 def parse_schema(directory: str, object_type: str, schema: str, object_name: str, definition: str, append: bool) -> None:
-    """ Writes or appends to schema file """
+    """ Writes or appends to schema file, the files are written out by write_schema_files """
 
     dir_path = f"{directory}/schema/{object_type}/{schema}"
 
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
+    if dir_path not in created_directories:
+        os.makedirs(dir_path, exist_ok=True)
+        created_directories.add(dir_path)
 
     file_name = f"{dir_path}/{object_name}.sql"
 
     if append:
-        if not os.path.exists(file_name):
-            with open(file_name, 'a', encoding='utf-8') as file:
-                file.write(definition)
-        else:
-            with open(file_name, 'r+', encoding='utf-8') as file:
-                current_content = [e+';\n' for e in read_in_chunk(file, ';\n') if e]
-                line_found = any(definition in line for line in current_content)
-                # if definition does not exist, append it to the schema file
-                if not line_found:
-                    file.seek(0, os.SEEK_END)
-                    file.write(definition)
+        # if definition does not exist, append it to the schema file
+        if definition not in written_definitions[file_name]:
+            written_definitions[file_name].add(definition)
+            pending_writes[file_name].append(definition)
     else:
+        written_definitions[file_name] = {definition}
+        pending_writes[file_name] = [definition]
+
+
+def write_schema_files() -> None:
+    """ Writes the definitions of each schema file in a single write """
+
+    for file_name, definitions in pending_writes.items():
         with open(file_name, 'w', encoding='utf-8') as file:
-            file.write(definition)
+            file.write(''.join(definitions))
 
 
 def parse_object(stream: str, object_type: str, append: bool = True) -> None:
     """ Parses tables, views, materialized views, sequences, types, aggregates, defaults, constraints, rules,
     triggers, clustered indexes, comments, extensions, foreign tables, partitions """
-    
-    # changed 'CREATE SEQUENCE' to 'CREATE.*SEQUENCE' to allow for UNLOGGED SEQUENCE.
-    # added 'CREATE COLLATION'
-    schema_name = re.match(r"^(CREATE.*TABLE|COMMENT ON \w+|CREATE AGGREGATE|CREATE.*VIEW|CREATE TYPE|CREATE DOMAIN|CREATE COLLATION|CREATE.*SEQUENCE|ALTER.*TABLE \w+|ALTER.*TABLE|GRANT.*ON \w+|REVOKE.*ON \w+|.*TRIGGER.*?ON|.*RULE.*\n.*?ON.*) (\w+).(\w+)", stream, re.I).group(2)
-    object_name = re.match(r"^(CREATE.*TABLE|COMMENT ON \w+|CREATE AGGREGATE|CREATE.*VIEW|CREATE TYPE|CREATE DOMAIN|CREATE COLLATION|CREATE.*SEQUENCE|ALTER.*TABLE \w+|ALTER.*TABLE|GRANT.*ON \w+|REVOKE.*ON \w+|.*TRIGGER.*?ON|.*RULE.*\n.*?ON.*) (\w+).(\w+)", stream, re.I).group(3)
+
+    schema_name, object_name = OBJECT_PATTERN.match(stream).group(2, 3)
     parse_schema(args.directory, object_type, schema_name, object_name, stream, append)
 
 
 def parse_indexes(stream: str, object_type: str, append: bool = False) -> None:
     """ Parses indexes """
-    index_name = re.match(r"^CREATE .*INDEX (\w+) ON (\w+).(\w+)", stream, re.I).group(1)
-    schema_name = re.match(r"^CREATE .*INDEX (\w+) ON (\w+).(\w+)", stream, re.I).group(2)
+    index_name, schema_name = INDEX_PATTERN.match(stream).group(1, 2)
     parse_schema(args.directory, object_type, schema_name, index_name, stream, append)
 
 
 def parse_extensions(stream: str, object_type: str, append: bool = False) -> None:
     """ Parses extensions """
-    extension_name = re.match(r"^CREATE EXTENSION.* (\w+) WITH SCHEMA (\w+)", stream, re.I).group(1)
-    schema_name = re.match(r"^CREATE EXTENSION.* (\w+) WITH SCHEMA (\w+)", stream, re.I).group(2)
+    extension_name, schema_name = EXTENSION_PATTERN.match(stream).group(1, 2)
     parse_schema(args.directory, object_type, schema_name, extension_name, stream, append)
 
 
 def parse_function(stream: str, object_type: str, append: bool = False) -> None:
     """ Parses function and procedure definition """
+    global warnings  # pylint: disable=W0603
 
     # see https://www.geeksforgeeks.org/postgresql-dollar-quoted-string-constants/
     # because PG functions' bodies can be written as dollar quotes and single quotes
     # we rely solely on pg_get_functiondef for parsing functions
 
-    host = config.get('postgresql', 'host')
-    port = config.get('postgresql', 'port')
-    dbname = config.get('postgresql', 'db')
-    user = config.get('postgresql', 'user')
-    password = config.get('postgresql', 'password')
-
-    schema_name = re.match(r"^(CREATE FUNCTION|CREATE OR REPLACE FUNCTION|CREATE PROCEDURE|CREATE OR REPLACE PROCEDURE) (\w+).(\w+)", stream, re.I).group(2)
-    func_name = re.match(r"^(CREATE FUNCTION|CREATE OR REPLACE FUNCTION|CREATE PROCEDURE|CREATE OR REPLACE PROCEDURE) (\w+).(\w+)", stream, re.I).group(3)
-
-    with subprocess.Popen(
-        ['psql',
-         f"--dbname=postgresql://{user}:{password}@{host}:{port}/{dbname}?application_name={APPLICATION_NAME}",
-         "-A",
-         "--no-align",
-         "--no-psqlrc",
-         "--tuples-only",
-         f"-c SELECT pg_catalog.string_agg(pg_catalog.pg_get_functiondef(f.oid), E';\n') || ';' AS def FROM (SELECT oid \
-             FROM pg_catalog.pg_proc WHERE proname = '{func_name}' AND pronamespace = '{schema_name}'::regnamespace) AS f"],
-        stdout=subprocess.PIPE
-         ) as func_def_proc:
-
-        func_def = func_def_proc.communicate()[0].decode('utf-8').strip()
+    schema_name, func_name = FUNCTION_PATTERN.match(stream).group(2, 3)
+    func_def = function_definitions.get((schema_name, func_name))
+    if func_def is None:
+        logger.warning("Definition of %s.%s not found in the database, skipping it", schema_name, func_name)
+        warnings = True
+        return
 
-        parse_schema(args.directory, object_type, schema_name, func_name, func_def + '\n', append)
+    parse_schema(args.directory, object_type, schema_name, func_name, func_def + '\n', append)
 
 
 def parse_utility(stream: str, utility_type: str, append: bool = True) -> None:
@@ -207,6 +263,143 @@ def parse_utility(stream: str, utility_type: str, append: bool = True) -> None:
     parse_schema(args.directory, 'utilities', 'others', utility_type, stream, append)
 
 
+def parse_object_or_utility(stream: str, object_type: str) -> None:
+    """ Parses schema-qualified acls and comments as objects, the rest as utilities """
+
+    match = OBJECT_PATTERN.match(stream)
+    if match:
+        schema_name, object_name = match.group(2, 3)
+        parse_schema(args.directory, object_type, schema_name, object_name, stream, True)
+    else:
+        parse_utility(stream, object_type)
+
+
+# segment classification rules, checked in order, the first matching rule wins.
+# each rule is a bucket name (which is also the object type), the leading keywords of the segments it applies to
+# (None for rules looking into the whole segment), the pattern that selects it and its parser
+ALTER_TABLE = r"^ALTER (?:FOREIGN )?TABLE"
+SEGMENT_RULES = [
+    ('tables', ('CREATE',), r"^CREATE (?:UNLOGGED |FOREIGN )?TABLE", parse_object),
+    # ALTER TABLE segments are resolved against TABLE_ALTERATIONS below
+    ('table_alterations', ('ALTER',), ALTER_TABLE, None),
+    ('indexes', ('CREATE',), r"^CREATE (?:UNIQUE )?INDEX", parse_indexes),
+    ('views', ('CREATE',), r"^CREATE (?:OR REPLACE |MATERIALIZED )?VIEW", parse_object),
+    ('aggregates', ('CREATE',), r"^CREATE AGGREGATE", parse_object),
+    ('functions', ('CREATE',), r"^CREATE (?:OR REPLACE )?FUNCTION", parse_function),
+    ('procedures', ('CREATE',), r"^CREATE (?:OR REPLACE )?PROCEDURE", parse_function),
+    ('types', ('CREATE',), r"^CREATE TYPE", parse_object),
+    ('domains', ('CREATE',), r"^CREATE DOMAIN", parse_object),
+    # added 'CREATE UNLOGGED SEQUENCE' option.
+    ('sequences', ('CREATE',), r"^CREATE (?:UNLOGGED )?SEQUENCE", parse_object),
+    ('triggers', None, r"^(?:CREATE (?:OR REPLACE )?(?:CONSTRAINT )?|ALTER )TRIGGER|(?s:.*?)DISABLE TRIGGER|(?s:.*?)ENABLE.*TRIGGER", parse_object),
+    ('rules', None, r"^(?:CREATE (?:OR REPLACE )?|ALTER )RULE|(?s:.*?)DISABLE RULE|(?s:.*?)ENABLE.*RULE", parse_object),
+    ('schemas', ('CREATE',), r"^CREATE SCHEMA", parse_utility),
+    ('ownerships', None, r"(?s:.*?)(?:OWNER TO|OWNED BY)", parse_utility),
+    ('acls', None, r"(?s:.*?)(?:GRANT|REVOKE)", parse_object_or_utility),
+    ('extensions', ('CREATE',), r"^CREATE EXTENSION", parse_extensions),
+    ('servers', ('CREATE',), r"^CREATE SERVER", parse_utility),
+    ('comments', ('COMMENT',), r"^COMMENT", parse_object_or_utility),
+    ('events', ('CREATE', 'ALTER'), r"^(?:CREATE|ALTER) EVENT TRIGGER", parse_utility),
+    ('mappings', ('CREATE',), r"^CREATE USER MAPPING", parse_utility),
+    # ownerships are matched above, so ALTER PUBLICATION and ALTER SUBSCRIPTION never carry an OWNER TO here
+    ('publications', ('CREATE', 'ALTER'), r"^(?:CREATE|ALTER) PUBLICATION", parse_utility),
+    ('subscriptions', ('CREATE', 'ALTER'), r"^(?:CREATE|ALTER) SUBSCRIPTION", parse_utility),
+    # added 'CREATE COLLATION' option.
+    ('collations', ('CREATE',), r"^CREATE COLLATION", parse_utility),
+]
+
+# ALTER TABLE rules, checked in order, the first rule with one of its keywords in the segment wins.
+# the keywords of all rules are found in a single pass over the segment with TABLE_KEYWORDS_PATTERN
+TABLE_ALTERATIONS = [
+    ('columns_mod', ('ALTER COLUMN',), parse_object),
+    ('clustered_indexes', ('CLUSTER ON',), parse_object),
+    ('constraints', ('ADD CONSTRAINT',), parse_object),
+    ('defaults', ('SET DEFAULT',), parse_object),
+    ('partitions', ('ATTACH PARTITION', 'INHERIT'), parse_object),
+    ('triggers', ('DISABLE TRIGGER', 'ENABLE TRIGGER'), parse_object),
+    ('rules', ('DISABLE RULE', 'ENABLE RULE'), parse_object),
+    ('ownerships', ('OWNER TO', 'OWNED BY'), parse_utility),
+    ('acls', ('GRANT', 'REVOKE'), parse_object_or_utility),
+    ('identities', ('ADD GENERATED ALWAYS AS IDENTITY',), parse_object),
+    ('row_level_securities', ('ROW LEVEL SECURITY',), parse_object),
+    ('replica_identities', ('REPLICA IDENTITY',), parse_object),
+]
+# none of the keywords contains another one, so the matches never hide each other.
+# ENABLE TRIGGER and ENABLE RULE also allow words in between, classify_table_alteration confirms them once ENABLE is found
+TABLE_KEYWORDS_PATTERN = re.compile('|'.join(
+    keyword for _, keywords, _ in TABLE_ALTERATIONS for keyword in keywords if not keyword.startswith('ENABLE ')
+) + '|ENABLE')
+
+HANDLERS = {bucket: parser for bucket, _, _, parser in SEGMENT_RULES if parser}
+HANDLERS.update({bucket: parser for bucket, _, parser in TABLE_ALTERATIONS})
+
+
+def classify_table_alteration(segment: str) -> str:
+    """ Returns the bucket of the first ALTER TABLE rule matching the segment, None if no rule matches """
+
+    keywords = set(TABLE_KEYWORDS_PATTERN.findall(segment))
+    if 'ENABLE' in keywords:
+        if ENABLE_TRIGGER_PATTERN.search(segment):
+            keywords.add('ENABLE TRIGGER')
+        if ENABLE_RULE_PATTERN.search(segment):
+            keywords.add('ENABLE RULE')
+
+    for bucket, bucket_keywords, _ in TABLE_ALTERATIONS:
+        if not keywords.isdisjoint(bucket_keywords):
+            return bucket
+    return None
+
+
+def compile_classifier(rules: list) -> tuple:
+    """ Compiles rules into a single alternation, and a Hyperscan database when available """
+
+    buckets = [bucket for bucket, _, _, _ in rules]
+    patterns = [pattern for _, _, pattern, _ in rules]
+
+    # the name of the matching group is the bucket of the segment
+    regex = re.compile('|'.join(f"(?P<{bucket}>{pattern})" for bucket, pattern in zip(buckets, patterns)))
+
+    database = None
+    if hyperscan:
+        # pattern ids are their position in rules, so the lowest matching id is the first matching rule
+        database = hyperscan.Database()
+        database.compile(
+            expressions=[pattern.encode('utf-8') for pattern in patterns],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(patterns),
+        )
+
+    return buckets, regex, database
+
+
+# segments are classified with the rules applying to their leading keyword only
+CLASSIFIERS = {
+    head: compile_classifier([rule for rule in SEGMENT_RULES if rule[1] is None or head in rule[1]])
+    for head in ('CREATE', 'ALTER', 'COMMENT')
+}
+OTHER_CLASSIFIER = compile_classifier([rule for rule in SEGMENT_RULES if rule[1] is None])
+
+
+def classify(segment: str) -> str:
+    """ Returns the bucket of the first rule matching the segment, None if no rule matches """
+
+    head, _, _ = segment.partition(' ')
+    buckets, regex, database = CLASSIFIERS.get(head, OTHER_CLASSIFIER)
+
+    if database is None:
+        match = regex.match(segment)
+        bucket = match.lastgroup if match else None
+    else:
+        matched = []
+        database.scan(segment.encode('utf-8'), match_event_handler=lambda rule, *_: matched.append(rule))
+        bucket = buckets[min(matched)] if matched else None
+
+    if bucket == 'table_alterations':
+        return classify_table_alteration(segment)
+    return bucket
+
+
 #  TODO: in a case a table depends on a user-defined function, we can simply add a dummy function before the create table
 
 
@@ -220,6 +413,13 @@ if __name__ == "__main__":
     args_parser.add_argument('--configfile', required=True, help="Database configuration file, see sample")
     args = args_parser.parse_args()
 
+    # pg_dump is looked up on the PATH once, its absolute path is used for every run of it
+    pg_dump_path = shutil.which('pg_dump') or shutil.which('pg_dump.exe')
+    if not pg_dump_path:
+        args_parser.error("pg_dump was not found on the PATH")
+    pg_dump_version = subprocess.run([pg_dump_path, "--version"], capture_output=True, check=True).stdout.decode('utf-8')
+    pg_dump_version = re.search(r"([0-9]*[.]?[0-9]+)", pg_dump_version.strip()).group(1)
+
     thisfolder = os.path.dirname(os.path.abspath(__file__))
     test_config_path = os.path.join(thisfolder, 'pg_schema_dump.config')
     config = configparser.ConfigParser()
@@ -233,6 +433,8 @@ if __name__ == "__main__":
     postgres_schema = config.get('postgresql', 'schema')
     postgres_user = config.get('postgresql', 'user')
     postgres_password = config.get('postgresql', 'password')
+    # the configuration is only read once, pg_dump and the catalog queries share the connection string
+    connection_string = f"postgresql://{postgres_user}:{postgres_password}@{postgres_host}:{postgres_port}/{postgres_db}?application_name={APPLICATION_NAME}"
 
     # clean up previous parse if it exists
     if os.path.exists(f"{args.directory}/schema"):
@@ -244,95 +446,36 @@ if __name__ == "__main__":
     #	Added postgres_schema to the function parameters.
     #
     
-    with pg_schema_dump(postgres_host, postgres_db, postgres_schema, postgres_port, postgres_user, postgres_password) as f:
-        logger.info(f"Started parser: {APPLICATION_NAME}")
-        for segment in read_in_chunk(f, separator=';\n'):
-            if segment:
-                segment = segment + ';\n'
-
-            if segment.startswith(("CREATE TABLE", "CREATE UNLOGGED TABLE", "CREATE FOREIGN TABLE")):
-                parse_object(segment, 'tables')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and "ALTER COLUMN" in segment:
-                parse_object(segment, 'columns_mod')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and "CLUSTER ON" in segment:
-                parse_object(segment, 'clustered_indexes')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and "ADD CONSTRAINT" in segment:
-                parse_object(segment, 'constraints')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and "SET DEFAULT" in segment:
-                parse_object(segment, 'defaults')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and ("ATTACH PARTITION" in segment or "INHERIT" in segment):
-                parse_object(segment, 'partitions')
-            elif segment.startswith(("CREATE INDEX", "CREATE UNIQUE INDEX")):
-                parse_indexes(segment, 'indexes')
-            elif segment.startswith(("CREATE VIEW", "CREATE OR REPLACE VIEW", "CREATE MATERIALIZED VIEW")):
-                parse_object(segment, 'views')
-            elif segment.startswith("CREATE AGGREGATE"):
-                parse_object(segment, 'aggregates')
-            elif segment.startswith(("CREATE FUNCTION", "CREATE OR REPLACE FUNCTION")):
-                parse_function(segment, 'functions')
-            elif segment.startswith(("CREATE PROCEDURE", "CREATE OR REPLACE PROCEDURE")):
-                parse_function(segment, 'procedures')
-            elif segment.startswith("CREATE TYPE"):
-                parse_object(segment, 'types')
-            elif segment.startswith("CREATE DOMAIN"):
-                parse_object(segment, 'domains')
-            # added 'CREATE UNLOGGED SEQUENCE' option.
-            elif segment.startswith(("CREATE SEQUENCE", "CREATE UNLOGGED SEQUENCE")):
-                parse_object(segment, 'sequences')
-            elif segment.startswith(("CREATE TRIGGER", "CREATE OR REPLACE TRIGGER", "CREATE CONSTRAINT TRIGGER", "CREATE OR REPLACE CONSTRAINT TRIGGER", "ALTER TRIGGER")) or "DISABLE TRIGGER" in segment or re.search(r"ENABLE.*TRIGGER", segment):
-                parse_object(segment, 'triggers')
-            elif segment.startswith(("CREATE RULE", "CREATE OR REPLACE RULE", "ALTER RULE")) or "DISABLE RULE" in segment or re.search(r"ENABLE.*RULE", segment):
-                parse_object(segment, 'rules')
-            elif segment.startswith("CREATE SCHEMA"):
-                parse_utility(segment, 'schemas')
-            elif ("OWNER TO" in segment or "OWNED BY" in segment):
-                parse_utility(segment, 'ownerships')
-            elif ("GRANT" in segment or "REVOKE" in segment) and re.search(r"\w+\.\w+", segment):
-                parse_object(segment, 'acls')
-            elif ("GRANT" in segment or "REVOKE" in segment) and not re.search(r"\w+\.\w+", segment):
-                parse_utility(segment, 'acls')
-            elif segment.startswith("CREATE EXTENSION"):
-                parse_extensions(segment, 'extensions')
-            elif segment.startswith("CREATE SERVER"):
-                parse_utility(segment, 'servers')
-            elif segment.startswith("COMMENT") and re.search(r"\w+\.\w+", segment):
-                parse_object(segment, 'comments')
-            elif segment.startswith("COMMENT") and not re.search(r"\w+\.\w+", segment):
-                parse_utility(segment, 'comments')
-            elif segment.startswith(("CREATE EVENT TRIGGER", "ALTER EVENT TRIGGER")):
-                parse_utility(segment, 'events')
-            elif segment.startswith("CREATE USER MAPPING"):
-                parse_utility(segment, 'mappings')
-            elif segment.startswith("CREATE PUBLICATION"):
-                parse_utility(segment, 'publications')
-            elif segment.startswith("ALTER PUBLICATION") and "OWNER TO" not in segment:
-                parse_utility(segment, 'publications')
-            elif segment.startswith("CREATE SUBSCRIPTION"):
-                parse_utility(segment, 'subscriptions')
-            elif segment.startswith("ALTER SUBSCRIPTION") and "OWNER TO" not in segment:
-                parse_utility(segment, 'subscriptions')
-            # added 'CREATE COLLATION' option.
-            elif segment.startswith("CREATE COLLATION"):
-                parse_utility(segment, 'collations')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and "ADD GENERATED ALWAYS AS IDENTITY" in segment:
-                parse_object(segment, 'identities')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and re.search(r".*ROW LEVEL SECURITY", segment):
-                parse_object(segment, 'row_level_securities')
-            elif segment.startswith(("ALTER TABLE", "ALTER FOREIGN TABLE")) and re.search(r"REPLICA IDENTITY", segment):
-                parse_object(segment, 'replica_identities')
-            elif segment.startswith(("CREATE", "ALTER")):
-                # if there are segments not parsed by us, we simply raise a warning to inform the caller of such
-                # printing the segment
-                # if you notice this, kindly create an issue on https://github.com/bolajiwahab/pg_schema_dump_parser with
-                # the segment sample
-                logger.warning("Parsing of %s not yet implemented, kindly create an issue on https://github.com/bolajiwahab/pg_schema_dump_parser", segment)
-                warnings = True
+    # a single connection is used for all catalog queries, it is closed once the dump is parsed
+    with psycopg.connect(connection_string, autocommit=True) as connection:
+        database_version = connection.execute('SHOW server_version').fetchone()[0]
+        function_definitions = get_function_definitions()
+
+        with pg_schema_dump(connection_string, postgres_schema) as f:
+            logger.info(f"Started parser: {APPLICATION_NAME}")
+            for segment in read_in_chunk(prefetch(clean_dump(f)), separator=b';\n'):
+                segment = segment.decode('utf-8')
+                if segment:
+                    segment = segment + ';\n'
+
+                bucket = classify(segment)
+                if bucket:
+                    HANDLERS[bucket](segment, bucket)
+                elif segment.startswith(("CREATE", "ALTER")):
+                    # if there are segments not parsed by us, we simply raise a warning to inform the caller of such
+                    # printing the segment
+                    # if you notice this, kindly create an issue on https://github.com/bolajiwahab/pg_schema_dump_parser with
+                    # the segment sample
+                    logger.warning("Parsing of %s not yet implemented, kindly create an issue on https://github.com/bolajiwahab/pg_schema_dump_parser", segment)
+                    warnings = True
+
+    write_schema_files()
 
     elapsed_time = f"{(time() - start_time):.2f} seconds"
 
     if warnings:
-        generate_metadata(args.directory, elapsed_time, warnings)
+        generate_metadata(args.directory, postgres_host, postgres_db, database_version, pg_dump_version, elapsed_time, warnings)
         logger.info("Schema parsing completed with warnings in %s", elapsed_time)
     else:
-        generate_metadata(args.directory, elapsed_time, warnings)
+        generate_metadata(args.directory, postgres_host, postgres_db, database_version, pg_dump_version, elapsed_time, warnings)
         logger.info("Schema parsing completed with no errors in %s", elapsed_time)